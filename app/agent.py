@@ -1,20 +1,395 @@
 """Research Agent using LangChain and Google Generative AI"""
 
 import os
+import re
+import json
 import asyncio
-from typing import List, Dict
+import hashlib
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, List, Dict
 from langchain_google_genai import ChatGoogleGenerativeAI
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
 
+try:
+    import numpy as np
+except ImportError:  # Only needed by the optional semantic cache
+    np = None
+
 # Load environment variables
 load_dotenv()
 
+# Read once at import; agents and the model listing share it
+_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# LangSmith tracing runs callbacks on every LLM call; keep it off unless enabled through any of its variables
+_TRACING_ENV_VARS = ("LANGSMITH_TRACING_V2", "LANGCHAIN_TRACING_V2", "LANGSMITH_TRACING", "LANGCHAIN_TRACING")
+if not any(name in os.environ for name in _TRACING_ENV_VARS):
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+# Per-call config: no callback handlers to dispatch events to
+_LLM_CONFIG = {"callbacks": []}
+
+logger = logging.getLogger(__name__)
+
+# Token usage reported when no tokens were spent (treat as read-only)
+_ZERO_USAGE = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+# User-facing error messages
+_QUOTA_EXCEEDED_TEMPLATE = (
+    "❌ **API Quota Exceeded**\n\n"
+    "You've hit your Google API rate limit. This usually means:\n\n"
+    "1. **Free tier quota exhausted** - Check your usage at https://makersuite.google.com/\n"
+    "2. **Too many requests** - Wait a few minutes and try again\n"
+    "3. **Daily limit reached** - Quota resets daily\n\n"
+    "💡 **Solutions:**\n"
+    "- Wait 1-2 minutes before trying again\n"
+    "- Use lower token limits (128-256) to conserve quota\n"
+    "- Consider enabling billing for higher limits\n"
+    "\n📋 **Error details:** {details}"
+)
+_RESEARCH_ERROR_TEMPLATE = (
+    "❌ **Error during research:**\n\n{details}\n\n"
+    "Please check your API key and try again."
+)
+
+# Quota/rate limit errors, which are worth retrying
+_RATE_LIMIT_ERROR_RE = re.compile(r"\b(429|RESOURCE_EXHAUSTED)\b")
+
+# Matches the server-suggested wait in Gemini 429 errors, e.g. "retry_delay { seconds: 12 }" or "'retryDelay': '12s'"
+_RETRY_DELAY_RE = re.compile(r"retry_?delay['\"]?\s*[:{]\s*(?:seconds:\s*)?['\"]?(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+# Retry attempts for rate limit (429) errors
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+# Longest wait before a retry; if the API asks for longer, the quota error is returned right away
+MAX_RETRY_WAIT = 30  # seconds
+
+
+def _retry_delay_seconds(error_str: str) -> float | None:
+    """Return the retry delay suggested by the API error, if any"""
+    match = _RETRY_DELAY_RE.search(error_str)
+    return float(match.group(1)) if match else None
+
+
+# Price tier keywords; a name matching several takes the cheapest tier, so "exp" beats "flash" beats "pro"
+_TIER_RE = re.compile(r"exp|flash|pro|ultra")
+_TIER_MAP = {"exp": 0, "flash": 1, "pro": 2, "ultra": 3}
+
+# Responses are cached for agents at or below this temperature ("deterministic enough" to replay)
+CACHE_MAX_TEMPERATURE = float(os.getenv("CACHE_MAX_TEMPERATURE", "0.3"))
+
+# Semantic cache: reuse answers to paraphrased questions (needs the "semantic-cache" extra)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+_EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# How long a fetched model list is reused before asking Google again
+MODELS_CACHE_TTL = 300  # seconds
+# After a failed listing, serve the fallback list this long before trying again
+MODELS_RETRY_AFTER = 30  # seconds
+
+_CLIENT: genai.Client | None = None
+_CLIENT_LOCK = threading.Lock()
+_EMBEDDER = None
+_MODELS_CACHE: tuple[float, list] | None = None
+_MODELS_FAILED_AT: float | None = None
+# The model listing in progress, shared by every caller waiting on a refresh
+_MODELS_REFRESH: asyncio.Task | None = None
+
+
+def _ensure_key() -> str:
+    """Return the Google API key, raising if it isn't configured"""
+    if not _API_KEY:
+        raise ValueError(
+            "GOOGLE_API_KEY not found in environment variables. "
+            "Please set it in your .env file or environment."
+        )
+    return _API_KEY
+
+
+def _get_genai_client(api_key: str) -> genai.Client:
+    """Get the shared google.genai client, creating it on first use"""
+    global _CLIENT
+    # The model listing creates it from a worker thread, so guard against creating two
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = genai.Client(api_key=api_key)
+        return _CLIENT
+
+
+async def close_shared_client() -> None:
+    """Close the shared google.genai client and its sync and async connection pools (call on app shutdown)"""
+    global _CLIENT
+    client, _CLIENT = _CLIENT, None
+    if client is None:
+        return
+    # Client.close() and AsyncClient.aclose() are only available in newer google-genai releases
+    close = getattr(client, "close", None)
+    if close is not None:
+        close()
+    aclose = getattr(client.aio, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+@lru_cache(maxsize=32)
+def _make_llm(model_name: str, temperature: float, max_tokens: int, api_key: str) -> ChatGoogleGenerativeAI:
+    """Create a chat model, reusing it (and its HTTP client) for agents with identical settings"""
+    return ChatGoogleGenerativeAI(
+        model=model_name,
+        temperature=temperature,
+        max_output_tokens=max_tokens,
+        google_api_key=api_key
+    )
+
+
+def load_embedder() -> None:
+    """
+    Load the semantic cache's sentence embedding model if the cache is enabled
+    
+    Importing torch and loading (possibly downloading) the model blocks for
+    seconds, so call this once at startup off the event loop. Agents created
+    before it has loaded run without a semantic cache.
+    """
+    global _EMBEDDER
+    if _EMBEDDER is not None or not SEMANTIC_CACHE_ENABLED or np is None:
+        return
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        logger.warning("sentence-transformers is not installed; semantic cache disabled")
+        return
+    try:
+        _EMBEDDER = SentenceTransformer(_EMBEDDING_MODEL_NAME)
+    except Exception as e:
+        # E.g. offline and the model isn't downloaded yet; the cache is optional, so carry on
+        logger.warning("Could not load embedding model %s; semantic cache disabled: %s", _EMBEDDING_MODEL_NAME, e)
+
+
+def _usage_from_nested_metadata(response) -> dict | None:
+    """Read token counts from response_metadata["usage_metadata"]"""
+    usage_metadata = getattr(response, 'response_metadata', {}).get('usage_metadata') or {}
+    if not usage_metadata.get('total_token_count'):
+        return None
+    return {
+        "prompt_tokens": usage_metadata.get('prompt_token_count', 0),
+        "completion_tokens": usage_metadata.get('candidates_token_count', 0),
+        "total_tokens": usage_metadata['total_token_count']
+    }
+
+
+def _usage_from_flat_metadata(response) -> dict | None:
+    """Read token counts stored directly in response_metadata"""
+    response_metadata = getattr(response, 'response_metadata', {})
+    if not response_metadata.get('total_token_count'):
+        return None
+    return {
+        "prompt_tokens": response_metadata.get('prompt_token_count', 0),
+        "completion_tokens": response_metadata.get('candidates_token_count', 0),
+        "total_tokens": response_metadata['total_token_count']
+    }
+
+
+def _usage_from_standard_metadata(response) -> dict | None:
+    """Read LangChain's standard usage_metadata (also where streamed chunks report usage)"""
+    usage_metadata = getattr(response, 'usage_metadata', None) or {}
+    if not usage_metadata.get('total_tokens'):
+        return None
+    return {
+        "prompt_tokens": usage_metadata.get('input_tokens', 0),
+        "completion_tokens": usage_metadata.get('output_tokens', 0),
+        "total_tokens": usage_metadata['total_tokens']
+    }
+
+
+# Token usage accessors in the order they are probed
+_TOKEN_EXTRACTORS: tuple[Callable[[Any], dict | None], ...] = (
+    _usage_from_nested_metadata,
+    _usage_from_flat_metadata,
+    _usage_from_standard_metadata,
+)
+
+
+class LLMCache:
+    """In-memory LRU cache for LLM responses"""
+
+    def __init__(self, max_size: int = 512):
+        """
+        Initialize the cache
+
+        Args:
+            max_size: Maximum number of responses to keep (least recently used are evicted first)
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, dict]] = OrderedDict()
+
+    @staticmethod
+    def make_key(model_name: str, temperature: float, max_tokens: int, prompt: str) -> str:
+        """Build a cache key from everything that determines the model's answer"""
+        payload = json.dumps(
+            {"model": model_name, "prompt": prompt, "temp": temperature, "max_tokens": max_tokens},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple[str, dict] | None:
+        """Return the cached (content, token usage) for a key, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        content, token_usage = entry
+        return content, dict(token_usage)
+
+    def set(self, key: str, value: tuple[str, dict]) -> None:
+        """Store a (content, token usage) pair, evicting the oldest entry if full"""
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Remove a key from the cache if present"""
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        """Get cache hit/miss counters and current size"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size
+        }
+
+
+class SemanticCache:
+    """Cache that matches paraphrased queries by embedding cosine similarity"""
+
+    # Rows are allocated in chunks to amortize growing the embedding matrix
+    _GROW_BY = 64
+
+    # Numbers and capitalized words (names, acronyms) of each query must appear in the
+    # other, so "CPC vs CPM" or "France vs Germany" never share an answer
+    _GUARD_TOKEN_RE = re.compile(r"\b(?:\w*[A-Z]\w*|\d+(?:[.,]\d+)*)\b")
+    _WORD_RE = re.compile(r"\b(?:\w*[A-Z]\w*|\d+(?:[.,]\d+)*)\b|\w+")
+
+    def __init__(self, embedder, threshold: float = 0.92, max_size: int = 512):
+        """
+        Initialize the cache
+
+        Args:
+            embedder: Sentence embedding model with an encode() method
+            threshold: Minimum cosine similarity for a cached answer to be reused
+            max_size: Maximum number of entries (the oldest are overwritten first)
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._entries: list[tuple[str, dict, frozenset, frozenset]] = []
+        self._next = 0
+
+    @classmethod
+    def _guard_tokens(cls, query: str) -> frozenset:
+        """Get the tokens that must match between paraphrases"""
+        first_word = re.search(r"\w", query)
+        tokens = set()
+        for match in cls._GUARD_TOKEN_RE.finditer(query):
+            token = match.group()
+            # A sentence-initial capital says nothing, unless the word is an acronym or has digits
+            if first_word is not None and match.start() == first_word.start():
+                if not (token.isupper() or any(char.isdigit() for char in token)):
+                    continue
+            # "I" is capitalized wherever it appears, so it isn't a name either
+            if token != "I":
+                tokens.add(token)
+        return frozenset(tokens)
+
+    @classmethod
+    def _guard_matches(cls, guard: frozenset, words: frozenset, query: str) -> bool:
+        """Check that each query's guard tokens appear among the other query's words"""
+        return guard <= frozenset(cls._WORD_RE.findall(query)) and cls._guard_tokens(query) <= words
+
+    def embed(self, query: str):
+        """Embed a query as an L2-normalized vector (CPU-bound; run off the event loop)"""
+        return self.embedder.encode(query, normalize_embeddings=True).astype(np.float32)
+
+    def lookup(self, embedding, query: str) -> tuple[str, dict] | None:
+        """Return the cached (content, token usage) of the most similar query above the threshold"""
+        if not self._entries:
+            self.misses += 1
+            return None
+        scores = self._matrix[:len(self._entries)] @ embedding
+        best = int(scores.argmax())
+        content, token_usage, guard, words = self._entries[best]
+        if scores[best] < self.threshold or not self._guard_matches(guard, words, query):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content, dict(token_usage)
+
+    def add(self, embedding, query: str, value: tuple[str, dict]) -> None:
+        """Store a (content, token usage) pair for a query, overwriting the oldest entry when full"""
+        content, token_usage = value
+        entry = (content, dict(token_usage), self._guard_tokens(query), frozenset(self._WORD_RE.findall(query)))
+        if self._matrix is None:
+            self._matrix = np.zeros((0, embedding.shape[0]), dtype=np.float32)
+        if len(self._entries) < self.max_size:
+            if len(self._entries) == self._matrix.shape[0]:
+                grow = np.zeros((self._GROW_BY, embedding.shape[0]), dtype=np.float32)
+                self._matrix = np.vstack([self._matrix, grow])
+            row = len(self._entries)
+            self._entries.append(entry)
+        else:
+            row = self._next
+            self._entries[row] = entry
+            self._next = (row + 1) % self.max_size
+        self._matrix[row] = embedding
+
+    def stats(self) -> dict:
+        """Get cache hit/miss counters and current size"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold
+        }
+
 
 class ResearchAgent:
     """AI Research Agent powered by Google Generative AI"""
     
+    # Optimized prompt for minimal token consumption; the query is appended to this prefix
+    _PROMPT_PREFIX_TEMPLATE = (
+        "Answer this concisely in {word_limit} words or less. "
+        "Be direct and factual. No preamble or conclusion.\n\n"
+        "Question: "
+    )
+    
+    # Several questions packed into one prompt, answered under "### Answer N" markers
+    _BATCH_PROMPT_TEMPLATE = (
+        "Answer each numbered question below separately, each in {word_limit} words or less. "
+        "Be direct and factual. No preamble or conclusion.\n"
+        "Start each answer with a line containing only \"### Answer N\", where N is the question number.\n\n"
+        "Questions:\n{questions}"
+    )
+    _ANSWER_MARKER_RE = re.compile(r"^[ \t]*#+[ \t]*Answer[ \t]+(\d+)[ \t]*:?[ \t]*$", re.MULTILINE | re.IGNORECASE)
+    
     def __init__(self, model_name: str = "gemini-2.0-flash-exp", temperature: float = 0.3, max_tokens: int = 512):
         """
         Initialize the Research Agent
@@ -24,23 +399,113 @@ class ResearchAgent:
             temperature: Controls randomness in responses (0-1) - lower = more focused
             max_tokens: Maximum tokens in response - lower = cheaper
         """
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError(
-                "GOOGLE_API_KEY not found in environment variables. "
-                "Please set it in your .env file or environment."
-            )
-        
-        self.llm = ChatGoogleGenerativeAI(
-            model=model_name,
-            temperature=temperature,
-            max_output_tokens=max_tokens,
-            google_api_key=api_key
-        )
+        self.llm = _make_llm(model_name, temperature, max_tokens, _ensure_key())
         self.model_name = model_name
+        self.temperature = temperature
         self.max_tokens = max_tokens
         
-    async def research(self, query: str, max_retries: int = 2) -> tuple[str, dict]:
+        # The instructions are identical for every query, so the prompt prefix is built once
+        self._prompt_prefix = self._PROMPT_PREFIX_TEMPLATE.format(word_limit=max_tokens // 2)
+        
+        # Token usage accessor that worked for this LLM, found on the first response
+        self._token_extractor: Callable[[Any], dict | None] | None = None
+        
+        # Cap in-flight Gemini calls per agent so bursts don't trip the quota
+        self._semaphore = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+        
+        # In-flight LLM calls keyed by cache key, shared by identical concurrent requests
+        self._inflight: dict[str, asyncio.Task] = {}
+        
+        # Only (near-)deterministic responses are safe to replay from cache
+        self._cache = LLMCache() if temperature <= CACHE_MAX_TEMPERATURE else None
+        self._semantic_cache = None
+        if self._cache is not None and _EMBEDDER is not None:
+            self._semantic_cache = SemanticCache(_EMBEDDER, threshold=SEMANTIC_CACHE_THRESHOLD)
+        
+    def _build_prompt(self, query: str) -> str:
+        """Build the token-optimized prompt for a query"""
+        return self._prompt_prefix + query
+    
+    def _extract_token_usage(self, response, prompt: str) -> dict:
+        """
+        Extract token usage from an LLM response, estimating it if the API didn't report any
+        
+        Args:
+            response: The (possibly aggregated streamed) LLM message
+            prompt: The prompt that produced the response, used for estimation
+            
+        Returns:
+            Token usage dict with prompt, completion and total token counts
+        """
+        logger.debug("Response metadata: %s", getattr(response, 'response_metadata', None))
+        
+        # Reuse the accessor that worked last time before probing every metadata path
+        token_usage = self._token_extractor(response) if self._token_extractor is not None else None
+        if token_usage is None:
+            for extractor in _TOKEN_EXTRACTORS:
+                token_usage = extractor(response)
+                if token_usage is not None:
+                    self._token_extractor = extractor
+                    break
+        
+        # If still no token count, estimate based on content
+        if token_usage is None:
+            # Rough estimation: ~3 characters per token for Gemini
+            content = getattr(response, 'content', '')
+            estimated_prompt = len(prompt) // 3
+            estimated_completion = len(content if isinstance(content, str) else str(content)) // 3
+            token_usage = {
+                "prompt_tokens": estimated_prompt,
+                "completion_tokens": estimated_completion,
+                "total_tokens": estimated_prompt + estimated_completion
+            }
+            logger.debug("Using estimated token counts: %s", token_usage)
+        
+        logger.debug("Final token usage: %s", token_usage)
+        return token_usage
+    
+    @staticmethod
+    def _error_result(error_str: str) -> tuple[str, dict]:
+        """Turn an LLM error into a user-facing message with zero token usage"""
+        if _RATE_LIMIT_ERROR_RE.search(error_str):
+            return _QUOTA_EXCEEDED_TEMPLATE.format(details=error_str[:200]), dict(_ZERO_USAGE)
+        
+        return _RESEARCH_ERROR_TEMPLATE.format(details=error_str), dict(_ZERO_USAGE)
+    
+    @staticmethod
+    def _cache_hit(content: str) -> tuple[str, dict]:
+        """Build the result for a cache hit; no tokens were spent"""
+        return content, {**_ZERO_USAGE, "cache_hit": True}
+    
+    async def _cached_result(self, cache_key: str, query: str) -> tuple[tuple[str, dict] | None, Any]:
+        """
+        Look up a response in the exact-match cache, then the semantic cache
+        
+        Returns:
+            Tuple of (cache hit result or None, query embedding to store the answer under or None)
+        """
+        if self._cache is None:
+            return None, None
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return self._cache_hit(cached[0]), None
+        if self._semantic_cache is None:
+            return None, None
+        
+        embedding = await asyncio.to_thread(self._semantic_cache.embed, query)
+        cached = self._semantic_cache.lookup(embedding, query)
+        if cached is not None:
+            return self._cache_hit(cached[0]), None
+        return None, embedding
+    
+    def _store_result(self, cache_key: str, query: str, embedding, content: str, token_usage: dict) -> None:
+        """Remember a successful response in the enabled caches"""
+        if self._cache is not None:
+            self._cache.set(cache_key, (content, dict(token_usage)))
+        if self._semantic_cache is not None and embedding is not None:
+            self._semantic_cache.add(embedding, query, (content, token_usage))
+    
+    async def research(self, query: str, max_retries: int = MAX_RETRIES) -> tuple[str, dict]:
         """
         Perform research on a given query (optimized for minimal token usage)
         
@@ -51,100 +516,223 @@ class ResearchAgent:
         Returns:
             Tuple of (response content, token usage dict)
         """
-        # Optimized prompt for minimal token consumption
-        optimized_prompt = (
-            f"Answer this concisely in {self.max_tokens//2} words or less. "
-            f"Be direct and factual. No preamble or conclusion.\n\n"
-            f"Question: {query}"
-        )
+        optimized_prompt = self._build_prompt(query)
+        cache_key = LLMCache.make_key(self.model_name, self.temperature, self.max_tokens, optimized_prompt)
+        
+        cached, embedding = await self._cached_result(cache_key, query)
+        if cached is not None:
+            return cached
+        
+        # Coalesce identical concurrent requests onto a single in-flight LLM call
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._invoke(query, optimized_prompt, cache_key, embedding, max_retries))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
         
+        # Shield so one caller cancelling doesn't cancel the call other callers are waiting on
+        content, token_usage = await asyncio.shield(task)
+        return content, dict(token_usage)
+    
+    async def _ainvoke_with_retries(self, llm: ChatGoogleGenerativeAI, prompt: str, max_retries: int):
+        """Call the LLM, retrying rate limit errors with backoff; the last error is re-raised"""
         for attempt in range(max_retries + 1):
             try:
-                response = await self.llm.ainvoke(optimized_prompt)
-                
-                # Extract token usage information
-                token_usage = {
-                    "prompt_tokens": 0,
-                    "completion_tokens": 0,
-                    "total_tokens": 0
-                }
-                
-                # Debug: Print response structure
-                print(f"Response type: {type(response)}")
-                print(f"Response attributes: {dir(response)}")
-                
-                # Try to get usage metadata from response - try multiple paths
-                if hasattr(response, 'response_metadata'):
-                    print(f"Response metadata: {response.response_metadata}")
-                    
-                    # Try usage_metadata path
-                    usage_metadata = response.response_metadata.get('usage_metadata', {})
-                    if usage_metadata:
-                        token_usage["prompt_tokens"] = usage_metadata.get('prompt_token_count', 0)
-                        token_usage["completion_tokens"] = usage_metadata.get('candidates_token_count', 0)
-                        token_usage["total_tokens"] = usage_metadata.get('total_token_count', 0)
-                    
-                    # Try direct token counts in response_metadata
-                    if token_usage["total_tokens"] == 0:
-                        token_usage["prompt_tokens"] = response.response_metadata.get('prompt_token_count', 0)
-                        token_usage["completion_tokens"] = response.response_metadata.get('candidates_token_count', 0)
-                        token_usage["total_tokens"] = response.response_metadata.get('total_token_count', 0)
-                
-                # If still no token count, estimate based on content
-                if token_usage["total_tokens"] == 0:
-                    # Rough estimation: ~4 characters per token
-                    estimated_prompt = len(optimized_prompt) // 4
-                    estimated_completion = len(str(response.content)) // 4
-                    token_usage["prompt_tokens"] = estimated_prompt
-                    token_usage["completion_tokens"] = estimated_completion
-                    token_usage["total_tokens"] = estimated_prompt + estimated_completion
-                    print(f"Using estimated token counts: {token_usage}")
-                
-                print(f"Final token usage: {token_usage}")
-                return response.content, token_usage
+                async with self._semaphore:
+                    return await llm.ainvoke(prompt, config=_LLM_CONFIG)
                 
             except Exception as e:
                 error_str = str(e)
                 
-                # Check for quota/rate limit errors
-                if '429' in error_str or 'RESOURCE_EXHAUSTED' in error_str:
-                    if attempt < max_retries:
-                        # Wait before retry (exponential backoff)
-                        wait_time = 2 ** attempt
-                        print(f"Rate limit hit, retrying in {wait_time} seconds...")
-                        await asyncio.sleep(wait_time)
-                        continue
+                # Retry quota/rate limit errors while attempts remain
+                if attempt < max_retries and _RATE_LIMIT_ERROR_RE.search(error_str):
+                    # Prefer the server's suggested delay, else exponential backoff with full jitter
+                    retry_delay = _retry_delay_seconds(error_str)
+                    if retry_delay is not None:
+                        # Don't hold the request open for a long server-suggested wait
+                        if retry_delay > MAX_RETRY_WAIT:
+                            raise
+                        wait_time = retry_delay + random.random()
                     else:
-                        # Out of retries, return friendly error message
-                        return (
-                            "❌ **API Quota Exceeded**\n\n"
-                            "You've hit your Google API rate limit. This usually means:\n\n"
-                            "1. **Free tier quota exhausted** - Check your usage at https://makersuite.google.com/\n"
-                            "2. **Too many requests** - Wait a few minutes and try again\n"
-                            "3. **Daily limit reached** - Quota resets daily\n\n"
-                            "💡 **Solutions:**\n"
-                            "- Wait 1-2 minutes before trying again\n"
-                            "- Use lower token limits (128-256) to conserve quota\n"
-                            "- Consider enabling billing for higher limits\n"
-                            f"\n📋 **Error details:** {error_str[:200]}",
-                            {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-                        )
-                
-                # Other errors
-                return (
-                    f"❌ **Error during research:**\n\n{error_str}\n\n"
-                    "Please check your API key and try again.",
-                    {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-                )
-        
-        # Should never reach here
-        return "Error: Max retries exceeded", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                        wait_time = random.uniform(0, min(2 ** attempt, MAX_RETRY_WAIT))
+                    logger.info("Rate limit hit, retrying in %.1f seconds...", wait_time)
+                    await asyncio.sleep(wait_time)
+                    continue
+                raise
+        
+        # Only reachable with a negative max_retries: the final attempt always returns or raises
+        raise RuntimeError("Max retries exceeded")
+    
+    async def _invoke(self, query: str, optimized_prompt: str, cache_key: str, embedding, max_retries: int) -> tuple[str, dict]:
+        """Call the LLM with retries on rate limit errors and cache the result"""
+        try:
+            response = await self._ainvoke_with_retries(self.llm, optimized_prompt, max_retries)
+        except Exception as e:
+            # Out of retries or a non-retryable error, return friendly error message
+            return self._error_result(str(e))
+        
+        token_usage = self._extract_token_usage(response, optimized_prompt)
+        self._store_result(cache_key, query, embedding, response.content, token_usage)
+        return response.content, token_usage
+    
+    @classmethod
+    def _split_batch_answers(cls, content, count: int) -> list[str] | None:
+        """Split a packed response into one answer per question, or None if it isn't well-formed"""
+        if not isinstance(content, str):
+            return None
+        markers = list(cls._ANSWER_MARKER_RE.finditer(content))
+        answers = {}
+        for marker, next_marker in zip(markers, markers[1:] + [None]):
+            end = next_marker.start() if next_marker is not None else len(content)
+            answers[int(marker.group(1))] = content[marker.end():end].strip()
+        if sorted(answers) != list(range(1, count + 1)) or not all(answers.values()):
+            return None
+        return [answers[number] for number in range(1, count + 1)]
+    
+    async def research_batch(self, queries: List[str], max_retries: int = MAX_RETRIES) -> List[tuple[str, dict]]:
+        """
+        Research several queries with a single packed LLM call
+        
+        Cached queries are answered from cache and duplicates are asked once. Answers
+        from a packed prompt are not cached, as other queries were part of their
+        context. If the packed response can't be split back into one answer per
+        question, each query is asked on its own instead.
+        
+        Args:
+            queries: The research questions
+            max_retries: Number of retry attempts for rate limit errors
+            
+        Returns:
+            List of (response content, token usage dict), one per query in order
+        """
+        results: list[tuple[str, dict] | None] = [None] * len(queries)
+        positions: dict[str, list[int]] = {}
+        misses: list[tuple[str, str, Any]] = []
+        for index, query in enumerate(queries):
+            cache_key = LLMCache.make_key(self.model_name, self.temperature, self.max_tokens, self._build_prompt(query))
+            if cache_key in positions:
+                positions[cache_key].append(index)
+                continue
+            cached, embedding = await self._cached_result(cache_key, query)
+            if cached is not None:
+                results[index] = cached
+                continue
+            positions[cache_key] = [index]
+            misses.append((cache_key, query, embedding))
+        
+        if len(misses) == 1:
+            cache_key, query, embedding = misses[0]
+            answers = [await self._invoke(query, self._build_prompt(query), cache_key, embedding, max_retries)]
+        elif misses:
+            answers = await self._invoke_batch(misses, max_retries)
+        else:
+            answers = []
+        
+        for (cache_key, _, _), (content, token_usage) in zip(misses, answers):
+            for index in positions[cache_key]:
+                results[index] = (content, dict(token_usage))
+        return results
+    
+    async def _invoke_batch(self, misses: list[tuple[str, str, Any]], max_retries: int) -> list[tuple[str, dict]]:
+        """Ask several uncached queries in one prompt and split the answers back out"""
+        questions = "\n".join(f"{number}. {query}" for number, (_, query, _) in enumerate(misses, 1))
+        prompt = self._BATCH_PROMPT_TEMPLATE.format_map({"word_limit": self.max_tokens // 2, "questions": questions})
+        
+        # Give every question the same output budget it would get on its own
+        llm = _make_llm(self.model_name, self.temperature, self.max_tokens * len(misses), _ensure_key())
+        try:
+            response = await self._ainvoke_with_retries(llm, prompt, max_retries)
+        except Exception as e:
+            return [self._error_result(str(e))] * len(misses)
+        
+        batch_usage = self._extract_token_usage(response, prompt)
+        prompt_tokens = batch_usage["prompt_tokens"] // len(misses)
+        
+        answers = self._split_batch_answers(response.content, len(misses))
+        if answers is None:
+            logger.warning(
+                "Could not split packed response (%d tokens spent), asking %d queries separately",
+                batch_usage["total_tokens"], len(misses)
+            )
+            results = await asyncio.gather(*(
+                self._invoke(query, self._build_prompt(query), cache_key, embedding, max_retries)
+                for cache_key, query, embedding in misses
+            ))
+            # The wasted packed call is still billed, so share it evenly across the queries
+            completion_tokens = batch_usage["completion_tokens"] // len(misses)
+            return [
+                (content, {
+                    "prompt_tokens": token_usage["prompt_tokens"] + prompt_tokens,
+                    "completion_tokens": token_usage["completion_tokens"] + completion_tokens,
+                    "total_tokens": token_usage["total_tokens"] + prompt_tokens + completion_tokens
+                })
+                for content, token_usage in results
+            ]
+        
+        # Attribute prompt tokens evenly and completion tokens by answer length. Answers
+        # aren't cached: each was written with the other callers' questions in context
+        total_chars = sum(len(answer) for answer in answers)
+        results = []
+        for answer in answers:
+            completion_tokens = batch_usage["completion_tokens"] * len(answer) // total_chars
+            token_usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+            results.append((answer, token_usage))
+        return results
+    
+    async def research_stream(self, query: str) -> AsyncIterator[dict]:
+        """
+        Stream research results as the model generates them
+        
+        Args:
+            query: The research question or topic
+            
+        Yields:
+            {"delta": str} for each chunk of text, then {"done": True, "token_usage": dict}
+        """
+        optimized_prompt = self._build_prompt(query)
+        
+        cache_key = LLMCache.make_key(self.model_name, self.temperature, self.max_tokens, optimized_prompt)
+        
+        cached, embedding = await self._cached_result(cache_key, query)
+        if cached is not None:
+            content, token_usage = cached
+            yield {"delta": content}
+            yield {"done": True, "token_usage": token_usage}
+            return
+        
+        # Aggregate chunks so the final message carries the full content and usage metadata
+        response = None
+        try:
+            async with self._semaphore:
+                async for chunk in self.llm.astream(optimized_prompt, config=_LLM_CONFIG):
+                    response = chunk if response is None else response + chunk
+                    if chunk.content:
+                        yield {"delta": chunk.content}
+        except Exception as e:
+            content, token_usage = self._error_result(str(e))
+            yield {"delta": content}
+            yield {"done": True, "token_usage": token_usage}
+            return
+        
+        token_usage = self._extract_token_usage(response, optimized_prompt)
+        if response is not None:
+            self._store_result(cache_key, query, embedding, response.content, token_usage)
+        yield {"done": True, "token_usage": token_usage}
     
     def get_info(self) -> dict:
         """Get information about the agent"""
         return {
             "model": self.model_name,
             "status": "ready",
+            "cache": {"enabled": True, **self._cache.stats()} if self._cache is not None else {"enabled": False},
+            "semantic_cache": (
+                {"enabled": True, **self._semantic_cache.stats()} if self._semantic_cache is not None
+                else {"enabled": False}
+            ),
             "capabilities": [
                 "Text generation",
                 "Research queries",
@@ -153,6 +741,39 @@ class ResearchAgent:
         }
 
 
+async def count_tokens_batch(texts: List[str], model_name: str = "gemini-2.0-flash-exp") -> List[dict]:
+    """
+    Count tokens for several texts with the model's own tokenizer
+    
+    Gemini's count_tokens returns one total per call, so the texts are counted
+    concurrently over the shared client. Texts that can't be counted (no API key,
+    API error) fall back to a ~3 characters per token estimate.
+    
+    Args:
+        texts: The texts to count
+        model_name: The model whose tokenizer to use
+        
+    Returns:
+        List of {"count": int, "estimated": bool}, one per text in order
+    """
+    client = _get_genai_client(_API_KEY) if _API_KEY else None
+    semaphore = asyncio.Semaphore(8)
+    
+    async def count(text: str) -> dict:
+        if client is not None:
+            try:
+                async with semaphore:
+                    result = await client.aio.models.count_tokens(model=model_name, contents=text)
+                # total_tokens is optional in the response; estimate when it's missing
+                if result.total_tokens is not None:
+                    return {"count": result.total_tokens, "estimated": False}
+            except Exception as e:
+                logger.debug("Token counting failed, estimating instead: %s", e)
+        return {"count": len(text) // 3, "estimated": True}
+    
+    return list(await asyncio.gather(*(count(text) for text in texts)))
+
+
 def get_model_price_tier(model_name: str) -> int:
     """
     Get price tier for a model (lower number = cheaper)
@@ -163,19 +784,101 @@ def get_model_price_tier(model_name: str) -> int:
     Returns:
         Price tier (0 = cheapest, higher = more expensive)
     """
-    model_lower = model_name.lower()
+    # Experimental and flash models are cheapest; unknown models default to mid-tier
+    return min((_TIER_MAP[keyword] for keyword in _TIER_RE.findall(model_name.lower())), default=1)
+
+
+def _model_to_dict(model) -> Dict[str, str]:
+    """Describe a google.genai model with its price tier and indicator"""
+    model_name = model.name.replace("models/", "") if hasattr(model, 'name') else str(model)
+    price_tier = get_model_price_tier(model_name)
+    
+    # Add price indicator emoji
+    price_emoji = "💰" * (price_tier + 1) if price_tier < 3 else "💰💰💰+"
+    
+    return {
+        "name": model_name,
+        "display_name": getattr(model, 'display_name', model_name),
+        "description": getattr(model, 'description', ''),
+        "price_tier": price_tier,
+        "price_indicator": price_emoji
+    }
+
+
+def models_cached_at() -> float | None:
+    """Return when the cached model list was fetched (time.monotonic()), or None if it isn't fresh"""
+    if _MODELS_CACHE is not None and time.monotonic() - _MODELS_CACHE[0] < MODELS_CACHE_TTL:
+        return _MODELS_CACHE[0]
+    return None
+
+
+def _cached_models() -> List[Dict[str, str]] | None:
+    """Return a copy of the cached model list if it is still fresh"""
+    if models_cached_at() is None:
+        return None
+    return list(_MODELS_CACHE[1])
+
+
+def _listing_recently_failed() -> bool:
+    """Check whether the last model listing failed less than MODELS_RETRY_AFTER ago"""
+    return _MODELS_FAILED_AT is not None and time.monotonic() - _MODELS_FAILED_AT < MODELS_RETRY_AFTER
+
+
+def _fallback_models() -> List[Dict[str, str]]:
+    """Default models to offer when the listing fails (sorted by price)"""
+    return [
+        {
+            "name": "gemini-2.0-flash-exp",
+            "display_name": "Gemini 2.0 Flash (Experimental)",
+            "description": "Latest experimental model",
+            "price_tier": 0,
+            "price_indicator": "💰"
+        },
+        {
+            "name": "gemini-1.5-flash",
+            "display_name": "Gemini 1.5 Flash",
+            "description": "Fast and efficient model",
+            "price_tier": 1,
+            "price_indicator": "💰💰"
+        },
+        {
+            "name": "gemini-1.5-pro",
+            "display_name": "Gemini 1.5 Pro",
+            "description": "Advanced model for complex tasks",
+            "price_tier": 2,
+            "price_indicator": "💰💰💰"
+        }
+    ]
+
+async def list_available_models_async() -> List[Dict[str, str]]:
+    """
+    List available models without blocking the event loop
+    
+    Cache hits return immediately; a refresh runs the blocking google.genai
+    listing call in a worker thread. Concurrent callers share one refresh.
+    
+    Returns:
+        List of model dictionaries, ordered by price (cheapest first)
+    """
+    global _MODELS_REFRESH
+    cached = _cached_models()
+    if cached is not None:
+        return cached
+    if _listing_recently_failed():
+        return _fallback_models()
     
-    # Experimental and flash models are cheapest
-    if 'exp' in model_lower or 'experimental' in model_lower:
-        return 0
-    elif 'flash' in model_lower:
-        return 1
-    elif 'pro' in model_lower:
-        return 2
-    elif 'ultra' in model_lower:
-        return 3
-    else:
-        return 1  # Default to mid-tier
+    if _MODELS_REFRESH is None:
+        _MODELS_REFRESH = asyncio.create_task(asyncio.to_thread(list_available_models))
+        _MODELS_REFRESH.add_done_callback(_clear_models_refresh)
+    # Shield so one caller cancelling doesn't cancel the refresh the others are waiting on
+    return list(await asyncio.shield(_MODELS_REFRESH))
+
+
+def _clear_models_refresh(task: asyncio.Task) -> None:
+    """Forget a finished model listing so the next cache miss starts a new one"""
+    global _MODELS_REFRESH
+    if _MODELS_REFRESH is task:
+        _MODELS_REFRESH = None
 
 
 def list_available_models() -> List[Dict[str, str]]:
@@ -186,76 +889,37 @@ def list_available_models() -> List[Dict[str, str]]:
     Returns:
         List of model dictionaries with name, display_name, and price_indicator
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    global _MODELS_CACHE, _MODELS_FAILED_AT
+    cached = _cached_models()
+    if cached is not None:
+        return cached
+    
+    if not _API_KEY:
         return []
+    if _listing_recently_failed():
+        return _fallback_models()
     
     try:
-        # Initialize client with the new API
-        client = genai.Client(api_key=api_key)
-        models = []
-        
-        # List models using the new API
-        for model in client.models.list():
-            # Filter for generative models (those that can generate content)
-            if hasattr(model, 'supported_generation_methods'):
-                if 'generateContent' in model.supported_generation_methods:
-                    model_name = model.name.replace("models/", "") if hasattr(model, 'name') else str(model)
-                    display_name = getattr(model, 'display_name', model_name)
-                    price_tier = get_model_price_tier(model_name)
-                    
-                    # Add price indicator emoji
-                    price_emoji = "💰" * (price_tier + 1) if price_tier < 3 else "💰💰💰+"
-                    
-                    models.append({
-                        "name": model_name,
-                        "display_name": display_name,
-                        "description": getattr(model, 'description', ''),
-                        "price_tier": price_tier,
-                        "price_indicator": price_emoji
-                    })
-            else:
-                # If no supported_generation_methods attribute, include all models
-                model_name = model.name.replace("models/", "") if hasattr(model, 'name') else str(model)
-                display_name = getattr(model, 'display_name', model_name)
-                price_tier = get_model_price_tier(model_name)
-                price_emoji = "💰" * (price_tier + 1) if price_tier < 3 else "💰💰💰+"
-                
-                models.append({
-                    "name": model_name,
-                    "display_name": display_name,
-                    "description": getattr(model, 'description', ''),
-                    "price_tier": price_tier,
-                    "price_indicator": price_emoji
-                })
+        client = _get_genai_client(_API_KEY)
+        
+        # Keep generative models (those that can generate content);
+        # models without supported_generation_methods are all included
+        models = [
+            _model_to_dict(model) for model in client.models.list()
+            if getattr(model, 'supported_generation_methods', None) is None
+            or 'generateContent' in model.supported_generation_methods
+        ]
         
-        # Sort by price tier (cheapest first)
-        models.sort(key=lambda x: x.get('price_tier', 1))
-        return models
+        # Sort by price tier (cheapest first) - a stable bucket sort, as there are only 4 tiers
+        buckets = [[], [], [], []]
+        for model_info in models:
+            buckets[min(model_info["price_tier"], 3)].append(model_info)
+        models = list(itertools.chain.from_iterable(buckets))
+        _MODELS_CACHE = (time.monotonic(), models)
+        return list(models)
         
     except Exception as e:
-        print(f"Error listing models: {e}")
-        # Return default models as fallback (sorted by price)
-        return [
-            {
-                "name": "gemini-2.0-flash-exp",
-                "display_name": "Gemini 2.0 Flash (Experimental)",
-                "description": "Latest experimental model",
-                "price_tier": 0,
-                "price_indicator": "💰"
-            },
-            {
-                "name": "gemini-1.5-flash",
-                "display_name": "Gemini 1.5 Flash",
-                "description": "Fast and efficient model",
-                "price_tier": 1,
-                "price_indicator": "💰💰"
-            },
-            {
-                "name": "gemini-1.5-pro",
-                "display_name": "Gemini 1.5 Pro",
-                "description": "Advanced model for complex tasks",
-                "price_tier": 2,
-                "price_indicator": "💰💰💰"
-            }
-        ]
+        logger.warning("Error listing models: %s", e)
+        _MODELS_FAILED_AT = time.monotonic()
+        return _fallback_models()
+
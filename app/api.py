@@ -1,85 +1,235 @@
 """FastAPI routes and endpoints"""
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from starlette.datastructures import Headers
+from pydantic import BaseModel, Field
 from pathlib import Path
+from contextlib import asynccontextmanager
+import asyncio
+import gzip
+import hashlib
+import math
 import os
-import time
-from collections import deque
 
-from app.agent import ResearchAgent, list_available_models
+import orjson
+
+from app.agent import (
+    MODELS_CACHE_TTL,
+    ResearchAgent,
+    close_shared_client,
+    count_tokens_batch,
+    list_available_models_async,
+    load_embedder,
+    models_cached_at,
+)
+from app.state import MAX_REQUESTS_PER_WINDOW, RATE_LIMIT_WINDOW, agent_cache, rate_limiter
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers on startup and stop them on shutdown"""
+    global _batch_queue, _batch_worker_task, _index_page
+    _index_page = _load_index_page()
+    # Load the semantic cache's embedding model before any agent is created, off the event loop
+    await asyncio.to_thread(load_embedder)
+    if BATCH_WINDOW_SECONDS > 0:
+        _batch_queue = asyncio.Queue()
+        _batch_worker_task = asyncio.create_task(_batch_worker())
+    yield
+    if _batch_worker_task is not None:
+        _batch_worker_task.cancel()
+        _batch_worker_task = None
+    await close_shared_client()
 
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Research Agent API",
     description="AI-powered research agent using Google Generative AI",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Check an Accept-Encoding header for gzip (or *) with a non-zero q-value"""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+class QualityGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that honours Accept-Encoding q-values, so "gzip;q=0" isn't compressed"""
+    
+    async def __call__(self, scope, receive, send):
+        # Starlette only checks for "gzip" as a substring of the header
+        if scope["type"] == "http" and not _accepts_gzip(Headers(scope=scope).get("accept-encoding", "")):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Compress larger responses (research results, model list) for clients that accept gzip.
+# Starlette 0.46+ leaves text/event-stream alone, so /research/stream events aren't held back
+GZIP_MINIMUM_SIZE = 1024  # bytes
+GZIP_COMPRESS_LEVEL = 5
+app.add_middleware(QualityGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_COMPRESS_LEVEL)
+
 # Mount static files
 static_path = Path(__file__).parent.parent / "static"
 if static_path.exists():
     app.mount("/static", StaticFiles(directory=str(static_path)), name="static")
 
+# Serialized (and gzipped) /models body, reused while the model list it was built from is cached
+_models_body: tuple[float, bytes, bytes] | None = None
+
+# The landing page, read once at startup as (body, ETag)
+_index_page: tuple[bytes, str] | None = None
+
 
-# Initialize agent cache (will be lazy-loaded per model and max_tokens)
-_agents: dict[tuple[str, int], ResearchAgent] = {}
+def _load_index_page() -> tuple[bytes, str] | None:
+    """Read index.html into memory and compute its ETag"""
+    index_path = static_path / "index.html"
+    if not index_path.exists():
+        return None
+    body = index_path.read_bytes()
+    return body, f'"{hashlib.md5(body).hexdigest()}"'
 
-# Simple rate limiter: track request timestamps
-_request_timestamps = deque(maxlen=50)  # Keep last 50 requests
-RATE_LIMIT_WINDOW = 60  # seconds
-MAX_REQUESTS_PER_WINDOW = 10  # Max 10 requests per minute for free tier
 
+# Allowed max_tokens range; values outside it are clamped before they become a cache key
+MIN_MAX_TOKENS = 64
+MAX_MAX_TOKENS = 2048
 
-def check_rate_limit():
+
+async def check_rate_limit():
     """Check if rate limit is exceeded"""
-    now = time.time()
-    
-    # Remove timestamps older than the window
-    while _request_timestamps and _request_timestamps[0] < now - RATE_LIMIT_WINDOW:
-        _request_timestamps.popleft()
-    
-    # Check if we're at the limit
-    if len(_request_timestamps) >= MAX_REQUESTS_PER_WINDOW:
-        # Calculate wait time
-        oldest_request = _request_timestamps[0]
-        wait_seconds = int(RATE_LIMIT_WINDOW - (now - oldest_request)) + 1
+    wait = await rate_limiter.acquire()
+    if wait > 0:
+        wait_seconds = math.ceil(wait)
         raise HTTPException(
             status_code=429,
             detail=f"Rate limit exceeded. Please wait {wait_seconds} seconds before trying again. "
-                   f"(Free tier limit: {MAX_REQUESTS_PER_WINDOW} requests per {RATE_LIMIT_WINDOW} seconds)"
+                   f"(Free tier limit: {MAX_REQUESTS_PER_WINDOW} requests per {RATE_LIMIT_WINDOW} seconds)",
+            headers={"Retry-After": str(wait_seconds)}
         )
-    
-    # Add current timestamp
-    _request_timestamps.append(now)
 
 
 def get_agent(model_name: str = "gemini-2.0-flash-exp", max_tokens: int = 512) -> ResearchAgent:
     """Get or create a research agent instance for a specific model and token limit"""
-    global _agents
+    max_tokens = min(max(max_tokens, MIN_MAX_TOKENS), MAX_MAX_TOKENS)
     cache_key = (model_name, max_tokens)
-    if cache_key not in _agents:
-        try:
-            _agents[cache_key] = ResearchAgent(model_name=model_name, max_tokens=max_tokens)
-        except ValueError as e:
-            raise HTTPException(status_code=500, detail=str(e))
-    return _agents[cache_key]
+    agent = agent_cache.get(cache_key)
+    if agent is not None:
+        return agent
+    
+    try:
+        agent = ResearchAgent(model_name=model_name, max_tokens=max_tokens)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    agent_cache.set(cache_key, agent)
+    return agent
+
+
+async def validate_model(model_name: str):
+    """Reject model names that aren't in the fetched model list"""
+    models = await list_available_models_async()
+    # Only a list fetched from Google is authoritative; without one (no API key, listing
+    # failed and the fallback was returned) let the request through and let the API decide
+    if models_cached_at() is None:
+        return
+    if model_name not in {model["name"] for model in models}:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown model '{model_name}'. See /models for the available models."
+        )
+
+
+# Micro-batching: /research queries arriving within a short window are packed into one LLM call.
+# Opt-in, as it puts different callers' queries into one prompt; 0 disables batching
+BATCH_WINDOW_SECONDS = int(os.getenv("RESEARCH_BATCH_WINDOW_MS", "0")) / 1000
+MAX_BATCH_SIZE = 8
+
+_batch_queue: asyncio.Queue | None = None
+_batch_worker_task: asyncio.Task | None = None
+_batch_tasks: set[asyncio.Task] = set()
+
+
+async def _batch_worker():
+    """Collect queued research queries into batches and dispatch them per agent"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_SECONDS
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), timeout))
+            except TimeoutError:
+                break
+        
+        # Only queries for the same agent (model and token limit) can share a prompt
+        groups: dict[int, tuple[ResearchAgent, list]] = {}
+        for agent, query, future in batch:
+            groups.setdefault(id(agent), (agent, []))[1].append((query, future))
+        for agent, items in groups.values():
+            task = asyncio.create_task(_run_batch(agent, items))
+            _batch_tasks.add(task)
+            task.add_done_callback(_batch_tasks.discard)
+
+
+async def _run_batch(agent: ResearchAgent, items: list[tuple[str, asyncio.Future]]):
+    """Run one batch of queries against an agent and resolve each caller's future"""
+    try:
+        if len(items) == 1:
+            results = [await agent.research(items[0][0])]
+        else:
+            results = await agent.research_batch([query for query, _ in items])
+    except Exception as e:
+        for _, future in items:
+            if not future.done():
+                future.set_exception(e)
+        return
+    
+    for (_, future), result in zip(items, results):
+        if not future.done():
+            future.set_result(result)
+
+
+async def submit_research(agent: ResearchAgent, query: str) -> tuple[str, dict]:
+    """Research a query, batching it with concurrent queries for the same agent when enabled"""
+    if _batch_worker_task is None:
+        return await agent.research(query)
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((agent, query, future))
+    return await future
 
 
 # Request/Response models
 class ResearchRequest(BaseModel):
-    query: str
-    model: str = "gemini-2.0-flash-exp"
-    max_tokens: int = 512  # Lower for free tier optimization
+    query: str = Field(min_length=1, max_length=4000)
+    model: str = Field(default="gemini-2.0-flash-exp", pattern=r"^[a-zA-Z0-9\-\.]+$")
+    max_tokens: int = Field(default=512, ge=MIN_MAX_TOKENS, le=MAX_MAX_TOKENS)  # Lower for free tier optimization
 
 
 class TokenUsage(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    cache_hit: bool = False
 
 
 class ResearchResponse(BaseModel):
@@ -89,14 +239,33 @@ class ResearchResponse(BaseModel):
     token_usage: TokenUsage
 
 
+class TokenizeBatchRequest(BaseModel):
+    inputs: list[str] = Field(min_length=1, max_length=20)  # Each input is one count_tokens call
+    model: str = Field(default="gemini-2.0-flash-exp", pattern=r"^[a-zA-Z0-9\-\.]+$")
+
+
+class TokenCount(BaseModel):
+    count: int
+    estimated: bool = False
+
+
+class TokenizeBatchResponse(BaseModel):
+    results: list[TokenCount]
+
+
 # Routes
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Serve the main HTML page"""
-    index_path = Path(__file__).parent.parent / "static" / "index.html"
-    if index_path.exists():
-        return FileResponse(index_path)
-    return {"message": "Research Agent API", "docs": "/docs"}
+    if _index_page is None:
+        return {"message": "Research Agent API", "docs": "/docs"}
+    
+    body, etag = _index_page
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="text/html", headers=headers)
 
 
 @app.get("/health")
@@ -123,15 +292,37 @@ async def agent_info():
 
 
 @app.get("/models")
-async def get_models():
+async def get_models(request: Request):
     """Get list of available Google Generative AI models"""
-    models = list_available_models()
-    if not models:
-        raise HTTPException(
-            status_code=500,
-            detail="Could not fetch models. Please check GOOGLE_API_KEY."
-        )
-    return {"models": models}
+    global _models_body
+    cached_at = models_cached_at()
+    if cached_at is None or _models_body is None or _models_body[0] != cached_at:
+        models = await list_available_models_async()
+        if not models:
+            raise HTTPException(
+                status_code=500,
+                detail="Could not fetch models. Please check GOOGLE_API_KEY."
+            )
+        body = orjson.dumps({"models": models})
+        compressed = gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+        # Only a fetched list is cached (not the fallback), so only its body is kept
+        cached_at = models_cached_at()
+        _models_body = (cached_at, body, compressed) if cached_at is not None else None
+    else:
+        _, body, compressed = _models_body
+    
+    # The server reuses a fetched list for MODELS_CACHE_TTL, so browsers can too; the fallback isn't cacheable
+    headers = {"Vary": "Accept-Encoding"}
+    if _models_body is not None:
+        headers["Cache-Control"] = f"public, max-age={MODELS_CACHE_TTL}"
+    else:
+        headers["Cache-Control"] = "no-store"
+    
+    # Serve the pre-compressed body; the middleware leaves already-encoded responses alone
+    if len(body) >= GZIP_MINIMUM_SIZE and _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(compressed, media_type="application/json", headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.post("/research", response_model=ResearchResponse)
@@ -147,10 +338,11 @@ async def research(request: ResearchRequest):
         Research results with token usage information
     """
     # Check rate limit before processing
-    check_rate_limit()
+    await check_rate_limit()
     
+    await validate_model(request.model)
     agent = get_agent(model_name=request.model, max_tokens=request.max_tokens)
-    result, token_usage = await agent.research(request.query)
+    result, token_usage = await submit_research(agent, request.query)
     
     return ResearchResponse(
         query=request.query,
@@ -158,3 +350,46 @@ async def research(request: ResearchRequest):
         model=agent.model_name,
         token_usage=TokenUsage(**token_usage)
     )
+
+
+@app.post("/research/stream")
+async def research_stream(request: ResearchRequest):
+    """
+    Stream research results as Server-Sent Events while they are generated
+    Rate limited to protect free tier quota
+    
+    Args:
+        request: Research request with query, model selection, and token limit
+        
+    Returns:
+        text/event-stream of {"delta": str} events, ending with {"done": true, "token_usage": {...}}
+    """
+    await check_rate_limit()
+    
+    await validate_model(request.model)
+    agent = get_agent(model_name=request.model, max_tokens=request.max_tokens)
+    
+    async def events():
+        async for event in agent.research_stream(request.query):
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.post("/tokenize/batch", response_model=TokenizeBatchResponse)
+async def tokenize_batch(request: TokenizeBatchRequest):
+    """
+    Count tokens for many inputs in one request (e.g. to pre-flight costs)
+    Rate limited like /research, as each input is counted by the Gemini API
+    
+    Args:
+        request: Texts to count (up to 20) and the model whose tokenizer to use
+        
+    Returns:
+        One token count per input, in order
+    """
+    await check_rate_limit()
+    
+    await validate_model(request.model)
+    results = await count_tokens_batch(request.inputs, request.model)
+    return TokenizeBatchResponse(results=[TokenCount(**result) for result in results])
@@ -0,0 +1,83 @@
+"""Shared application state: rate limiter and agent cache
+
+Routes import these singletons instead of defining their own, so every
+endpoint draws from the same rate limit and reuses the same agents.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from app.agent import ResearchAgent
+
+
+RATE_LIMIT_WINDOW = 60  # seconds
+MAX_REQUESTS_PER_WINDOW = 10  # Max 10 requests per minute for free tier
+
+MAX_CACHED_AGENTS = 32
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: constant time and memory per request"""
+    
+    def __init__(self, capacity: int, window: float):
+        """
+        Initialize the bucket
+        
+        Args:
+            capacity: Maximum burst size, and number of requests allowed per window
+            window: Seconds it takes to refill an empty bucket
+        """
+        self.capacity = capacity
+        self.rate = capacity / window  # tokens per second
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> float:
+        """
+        Take a token from the bucket
+        
+        Returns:
+            0 if a token was taken, otherwise seconds until one becomes available
+        """
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+            return 0.0
+
+
+class AgentCache:
+    """LRU cache of research agents keyed by (model, max_tokens)"""
+    
+    def __init__(self, max_size: int):
+        """
+        Initialize the cache
+        
+        Args:
+            max_size: Maximum number of agents to keep (least recently used are evicted first)
+        """
+        self.max_size = max_size
+        self._agents: OrderedDict[tuple[str, int], ResearchAgent] = OrderedDict()
+    
+    def get(self, key: tuple[str, int]) -> ResearchAgent | None:
+        """Return the agent for a key, or None if it isn't cached"""
+        agent = self._agents.get(key)
+        if agent is not None:
+            self._agents.move_to_end(key)
+        return agent
+    
+    def set(self, key: tuple[str, int], agent: ResearchAgent) -> None:
+        """Store an agent, evicting the least recently used one if full"""
+        self._agents[key] = agent
+        self._agents.move_to_end(key)
+        if len(self._agents) > self.max_size:
+            self._agents.popitem(last=False)
+
+
+rate_limiter = TokenBucket(MAX_REQUESTS_PER_WINDOW, RATE_LIMIT_WINDOW)
+agent_cache = AgentCache(MAX_CACHED_AGENTS)
@@ -154,7 +154,10 @@ async function performResearch() {
             const totalTokens = data.token_usage.total_tokens || 0;
             
             const isEstimated = totalTokens > 0 && (promptTokens + completionTokens > 0);
-            const estimatedLabel = isEstimated ? '' : ' <span style="font-size:0.8em;">(estimated)</span>';
+            let estimatedLabel = isEstimated ? '' : ' <span style="font-size:0.8em;">(estimated)</span>';
+            if (data.token_usage.cache_hit) {
+                estimatedLabel = ' <span style="font-size:0.8em;">(cached - no tokens used)</span>';
+            }
             
             tokenUsageDiv.innerHTML = `
                 <strong>📊 Token Usage:</strong>${estimatedLabel}<br>
@@ -0,0 +1,146 @@
+"""Tests for micro-batching: answer splitting, queue grouping and token attribution"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import app.agent as agent_module
+import app.api as api
+from app.agent import ResearchAgent
+
+
+def fake_response(content: str, prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    """Build an LLM message reporting token usage the way LangChain does"""
+    return SimpleNamespace(
+        content=content,
+        response_metadata={},
+        usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    )
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    """A cache-enabled agent whose LLM calls never leave the process"""
+    monkeypatch.setattr(agent_module, "_API_KEY", "test-key")
+    return ResearchAgent(model_name="gemini-2.0-flash-exp", temperature=0.0, max_tokens=128)
+
+
+class TestSplitBatchAnswers:
+    def test_splits_marked_answers(self):
+        content = "### Answer 1\nParis\n\n### Answer 2\nBerlin\n"
+        assert ResearchAgent._split_batch_answers(content, 2) == ["Paris", "Berlin"]
+
+    def test_reorders_answers_by_number(self):
+        content = "### Answer 2\nBerlin\n### Answer 1:\nParis"
+        assert ResearchAgent._split_batch_answers(content, 2) == ["Paris", "Berlin"]
+
+    def test_multiline_answers_are_kept_whole(self):
+        content = "## Answer 1\nLine one\nLine two\n## Answer 2\nOther"
+        assert ResearchAgent._split_batch_answers(content, 2) == ["Line one\nLine two", "Other"]
+
+    @pytest.mark.parametrize("content", [
+        "### Answer 1\nParis",                                  # missing answer
+        "### Answer 1\nParis\n### Answer 2\n",                  # empty answer
+        "### Answer 1\nParis\n### Answer 3\nRome",              # wrong number
+        "**Answer 1**\nParis\n**Answer 2**\nBerlin",            # unsupported marker style
+        "1. Paris\n2. Berlin",                                  # no markers at all
+    ])
+    def test_malformed_responses_return_none(self, content):
+        assert ResearchAgent._split_batch_answers(content, 2) is None
+
+    def test_non_text_content_returns_none(self):
+        assert ResearchAgent._split_batch_answers([{"type": "text", "text": "x"}], 1) is None
+
+
+class TestResearchBatch:
+    def test_attributes_tokens_and_does_not_cache_packed_answers(self, agent, monkeypatch):
+        prompts = []
+
+        async def ainvoke(llm, prompt, max_retries):
+            prompts.append(prompt)
+            return fake_response("### Answer 1\n" + "a" * 10 + "\n### Answer 2\n" + "b" * 20, 100, 90)
+
+        monkeypatch.setattr(agent, "_ainvoke_with_retries", ainvoke)
+        results = asyncio.run(agent.research_batch(["First?", "Second?"]))
+
+        assert len(prompts) == 1
+        assert results == [
+            ("a" * 10, {"prompt_tokens": 50, "completion_tokens": 30, "total_tokens": 80}),
+            ("b" * 20, {"prompt_tokens": 50, "completion_tokens": 60, "total_tokens": 110}),
+        ]
+        assert agent._cache.stats()["size"] == 0
+
+    def test_unsplittable_response_falls_back_and_keeps_packed_usage(self, agent, monkeypatch):
+        async def ainvoke(llm, prompt, max_retries):
+            if "Questions:" in prompt:
+                return fake_response("**Answer 1**\nx\n**Answer 2**\ny", 100, 40)
+            return fake_response("solo", 10, 5)
+
+        monkeypatch.setattr(agent, "_ainvoke_with_retries", ainvoke)
+        results = asyncio.run(agent.research_batch(["First?", "Second?"]))
+
+        # Each query pays for its own call plus half of the wasted packed call
+        expected = {"prompt_tokens": 60, "completion_tokens": 25, "total_tokens": 85}
+        assert results == [("solo", expected), ("solo", expected)]
+        # The separate single-query answers are safe to cache
+        assert agent._cache.stats()["size"] == 2
+
+    def test_duplicates_and_cache_hits_skip_the_packed_call(self, agent, monkeypatch):
+        prompts = []
+
+        async def ainvoke(llm, prompt, max_retries):
+            prompts.append(prompt)
+            return fake_response("solo", 10, 5)
+
+        monkeypatch.setattr(agent, "_ainvoke_with_retries", ainvoke)
+        asyncio.run(agent.research("Cached?"))
+        results = asyncio.run(agent.research_batch(["Cached?", "New?", "New?"]))
+
+        # Only "New?" was asked, once, as a single-query prompt
+        assert len(prompts) == 2 and "Questions:" not in prompts[1]
+        assert results[0][1]["cache_hit"] is True
+        assert results[1] == results[2] == ("solo", {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15})
+
+
+class TestBatchWorker:
+    @staticmethod
+    async def run_worker(monkeypatch, items, max_batch_size=8):
+        """Feed items through _batch_worker and return the batches it dispatched"""
+        batches = []
+
+        async def run_batch(agent, batch_items):
+            batches.append((agent, [query for query, _ in batch_items]))
+            for query, future in batch_items:
+                future.set_result((query, {}))
+
+        monkeypatch.setattr(api, "_run_batch", run_batch)
+        monkeypatch.setattr(api, "BATCH_WINDOW_SECONDS", 0.05)
+        monkeypatch.setattr(api, "MAX_BATCH_SIZE", max_batch_size)
+        monkeypatch.setattr(api, "_batch_queue", asyncio.Queue())
+
+        worker = asyncio.create_task(api._batch_worker())
+        futures = []
+        for agent, query in items:
+            future = asyncio.get_running_loop().create_future()
+            futures.append(future)
+            await api._batch_queue.put((agent, query, future))
+        await asyncio.wait_for(asyncio.gather(*futures), 1)
+        worker.cancel()
+        return batches
+
+    def test_groups_queries_by_agent(self, monkeypatch):
+        agent_a, agent_b = object(), object()
+        items = [(agent_a, "q1"), (agent_b, "q2"), (agent_a, "q3")]
+        batches = asyncio.run(self.run_worker(monkeypatch, items))
+        assert batches == [(agent_a, ["q1", "q3"]), (agent_b, ["q2"])]
+
+    def test_caps_batch_size(self, monkeypatch):
+        agent = object()
+        items = [(agent, f"q{number}") for number in range(5)]
+        batches = asyncio.run(self.run_worker(monkeypatch, items, max_batch_size=2))
+        assert batches == [(agent, ["q0", "q1"]), (agent, ["q2", "q3"]), (agent, ["q4"])]
@@ -0,0 +1,22 @@
+"""Tests for Accept-Encoding negotiation"""
+
+import pytest
+
+from app.api import _accepts_gzip
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", True),
+    ("GZIP", True),
+    ("br, gzip;q=0.5", True),
+    ("*", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, br", False),
+    ("*, gzip;q=0", False),
+    ("*;q=0", False),
+    ("identity", False),
+    ("gzip;q=invalid", False),
+    ("", False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert _accepts_gzip(accept_encoding) is expected
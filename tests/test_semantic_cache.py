@@ -0,0 +1,41 @@
+"""Tests for the semantic cache's lexical guard"""
+
+import pytest
+
+from app.agent import SemanticCache
+
+
+def guard_matches(cached_query: str, query: str) -> bool:
+    """Check whether an answer cached for one query may be reused for another"""
+    guard = SemanticCache._guard_tokens(cached_query)
+    words = frozenset(SemanticCache._WORD_RE.findall(cached_query))
+    return SemanticCache._guard_matches(guard, words, query)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Capital of France?", "France's capital?"),
+    ("What is the capital of France?", "France's capital?"),
+    ("Top 3 largest countries", "Best 3 largest countries"),
+    ("Name the CEO of Apple", "Who is Apple's CEO?"),
+    ("Can I visit France?", "Is France visitable?"),
+])
+def test_paraphrases_pass_the_guard(first, second):
+    assert guard_matches(first, second)
+    assert guard_matches(second, first)
+
+
+@pytest.mark.parametrize("first, second", [
+    ("What is CPC?", "What is CPM?"),
+    ("Compare France vs Germany", "Compare France vs Spain"),
+    ("Top 3 largest countries", "Top 5 largest countries"),
+    ("GDP of France", "France's GDP in 2020"),
+])
+def test_different_names_and_numbers_fail_the_guard(first, second):
+    assert not guard_matches(first, second)
+    assert not guard_matches(second, first)
+
+
+def test_first_word_counts_when_it_is_an_acronym_or_has_digits():
+    assert SemanticCache._guard_tokens("CPC explained") == {"CPC"}
+    assert SemanticCache._guard_tokens("2024 elections") == {"2024"}
+    assert SemanticCache._guard_tokens("Explain the CPC") == {"CPC"}